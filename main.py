@@ -1,51 +1,110 @@
 import os
 import json
+import codecs
+import hashlib
+import queue
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 import subprocess
 import threading
 import signal
+import stat
+import tempfile
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 class PersistentHashMap:
     def __init__(self, filename='data.json'):
         self.filename = filename
         self.data = self._load_data()
+        self._dirty = False
+        self._buffer_depth = 0
+        self._save_lock = threading.Lock()
+        umask = os.umask(0)
+        os.umask(umask)
+        self._default_mode = 0o666 & ~umask
 
     def _load_data(self):
         if os.path.exists(self.filename):
-            with open(self.filename, 'r') as file:
-                try:
-                    return json.load(file)
-                except json.JSONDecodeError:
-                    return {}
+            with open(self.filename, 'rb') as file:
+                buf = file.read()
+            try:
+                if orjson:
+                    return orjson.loads(buf)
+                return json.loads(buf)
+            except json.JSONDecodeError:
+                return {}
         return {}
 
     def _save_data(self):
-        with open(self.filename, 'w') as file:
-            json.dump(self.data, file, indent=4)
+        with self._save_lock:
+            if orjson:
+                content = orjson.dumps(self.data, option=orjson.OPT_INDENT_2)
+            else:
+                content = json.dumps(self.data, indent=4).encode()
+            fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.filename)), prefix=os.path.basename(self.filename) + '.', suffix='.tmp')
+            try:
+                os.chmod(tmp_filename, self._file_mode())
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(content)
+                os.replace(tmp_filename, self.filename)
+            except BaseException:
+                os.unlink(tmp_filename)
+                raise
+            self._dirty = False
+
+    def _file_mode(self):
+        try:
+            return stat.S_IMODE(os.stat(self.filename).st_mode)
+        except FileNotFoundError:
+            return self._default_mode
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._buffer_depth == 0:
+            self._save_data()
+
+    def flush(self):
+        if self._dirty:
+            self._save_data()
+
+    @contextmanager
+    def buffered(self):
+        self._buffer_depth += 1
+        try:
+            yield self
+        finally:
+            self._buffer_depth -= 1
+            if self._buffer_depth == 0:
+                self.flush()
 
     def set(self, key, value):
         self.data[key] = value
-        self._save_data()
+        self._mark_dirty()
 
     def get(self, key):
         return self.data.get(key, None)
     
     def get_or_default(self, key, default):
-        if key not in self.data:
-            self.set(key, default)
         return self.data.get(key, default)
     
     def add_dict(self, key, sub_key, sub_value):
         if key not in self.data:
             self.data[key] = {}
         self.data[key][sub_key] = sub_value
-        self._save_data()
+        self._mark_dirty()
 
     def remove_dict(self, key, sub_key):
         if key in self.data and sub_key in self.data[key]:
             del self.data[key][sub_key]
-            self._save_data()
+            self._mark_dirty()
 
 mapVariables = PersistentHashMap()
 BASE_PATH = mapVariables.get_or_default('projects_dir', os.path.dirname(os.path.abspath(__file__)))
@@ -57,52 +116,239 @@ def is_process_running(pid):
         return False
     return True
 
-def run_command(command, project_name, log_widget):
+STOP_TIMEOUT_S = 2
+STOP_POLL_INTERVAL_S = 0.05
+
+def terminate_process_group(pid):
+    pgid = os.getpgid(pid)
+    os.killpg(pgid, signal.SIGTERM)
+    deadline = time.monotonic() + STOP_TIMEOUT_S
+    while time.monotonic() < deadline:
+        try:
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(STOP_POLL_INTERVAL_S)
+    os.killpg(pgid, signal.SIGKILL)
+
+LOG_DRAIN_INTERVAL_MS = 50
+LOG_DRAIN_IDLE_INTERVAL_MS = 250
+LOG_BUFFER_MAXLEN = 5000
+log_queue = queue.Queue()
+ui_queue = queue.Queue()
+log_buffers = {}
+selected_log_project = None
+
+def get_log_buffer(project_name):
+    if project_name not in log_buffers:
+        log_buffers[project_name] = deque(maxlen=LOG_BUFFER_MAXLEN)
+    return log_buffers[project_name]
+
+def append_log(project_name, text):
+    log_queue.put((project_name, text))
+
+def post_to_ui(callback):
+    ui_queue.put(callback)
+
+def drain_log_queue():
+    busy = False
+    try:
+        busy = drain_pending()
+    finally:
+        root.after(LOG_DRAIN_INTERVAL_MS if busy else LOG_DRAIN_IDLE_INTERVAL_MS, drain_log_queue)
+
+def drain_pending():
+    busy = False
+    while True:
+        try:
+            callback = ui_queue.get_nowait()
+        except queue.Empty:
+            break
+        busy = True
+        try:
+            callback()
+        except Exception:
+            traceback.print_exc()
+    pending = {}
+    while True:
+        try:
+            project_name, chunk = log_queue.get_nowait()
+        except queue.Empty:
+            break
+        pending.setdefault(project_name, []).append(chunk)
+    for project_name, chunks in pending.items():
+        text = ''.join(chunks)
+        append_log_lines(get_log_buffer(project_name), text)
+        if project_name == selected_log_project:
+            at_bottom = log_text.yview()[1] >= 0.999
+            log_text.insert(tk.END, text)
+            trim_log_text()
+            if at_bottom:
+                log_text.see(tk.END)
+    return busy or bool(pending)
+
+def append_log_lines(log_buffer, text):
+    if log_buffer and not log_buffer[-1].endswith('\n'):
+        text = log_buffer.pop() + text
+    lines, sep, remainder = text.rpartition('\n')
+    if sep:
+        log_buffer.extend(line + '\n' for line in lines.split('\n'))
+    if remainder:
+        log_buffer.append(remainder)
+
+def trim_log_text():
+    excess = int(log_text.index('end-1c').split('.')[0]) - LOG_BUFFER_MAXLEN
+    if excess > 0:
+        log_text.delete('1.0', f'{excess + 1}.0')
+
+def show_log(project_name):
+    global selected_log_project
+    if project_name == selected_log_project:
+        return
+    selected_log_project = project_name
+    log_text.delete('1.0', tk.END)
+    log_text.insert(tk.END, ''.join(get_log_buffer(project_name)))
+    log_text.yview(tk.END)
+
+PIPE_READ_SIZE = 65536
+
+def pipe_to_log(stream, project_name):
+    buf = bytearray(PIPE_READ_SIZE)
+    view = memoryview(buf)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    remainder = ''
+    while True:
+        n = stream.readinto(buf)
+        if not n:
+            break
+        lines, sep, remainder = (remainder + decoder.decode(view[:n])).rpartition('\n')
+        if sep:
+            append_log(project_name, lines + sep)
+    remainder += decoder.decode(b'', final=True)
+    if remainder:
+        append_log(project_name, remainder)
+    stream.close()
+
+_live_processes = {}
+
+def spawn_command(command, project_name):
     print(command)
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, preexec_fn=os.setsid)
-    mapVariables.add_dict('PIDS', project_name, process.pid)
-    for line in iter(process.stdout.readline, b''):
-        log_widget.insert(tk.END, line.decode('utf-8'))
-        log_widget.yview(tk.END)
-    process.stdout.close()
-    process.wait()
-
-def start_project(project_name, log_widget):
-    if check_and_stop_process(project_name, log_widget):
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True, preexec_fn=os.setsid, bufsize=0)
+    _live_processes[project_name] = process
+    post_to_ui(lambda: mapVariables.add_dict('PIDS', project_name, process.pid))
+    return process
+
+def run_command(process, project_name):
+    pipe_to_log(process.stdout, project_name)
+    returncode = process.wait()
+    post_to_ui(lambda: on_process_exit(project_name, process.pid, returncode))
+
+def on_process_exit(project_name, pid, returncode):
+    process = _live_processes.get(project_name)
+    if process is not None and process.pid == pid:
+        del _live_processes[project_name]
+    processes = mapVariables.get('PIDS') or {}
+    if processes.get(project_name) != pid:
         return
+    with mapVariables.buffered():
+        mapVariables.remove_dict('PIDS', project_name)
+        if returncode != 0:
+            mapVariables.remove_dict('BUILD_HASHES', project_name)
+    append_log(project_name, f'{project_name} finalizado (código {returncode})\n')
+
+_MVN_COMMAND_TMPL = 'cd {path} && mvn {goals} spring-boot:run -Dspring-boot.run.arguments="{args}"'
+
+def build_command(project_name, env_vars, clean=True):
+    return _MVN_COMMAND_TMPL.format(
+        path=os.path.join(BASE_PATH, project_name),
+        goals='clean compile' if clean else 'compile',
+        args=' --'.join(f'{key}={value}' for key, value in env_vars.items()),
+    )
+
+def source_fingerprint(project_path):
+    digest = hashlib.blake2b()
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(project_path):
+        dirnames[:] = sorted(name for name in dirnames if name != 'target' and not name.startswith('.'))
+        in_src = 'src' in os.path.relpath(dirpath, project_path).split(os.sep)
+        paths.extend(os.path.join(dirpath, filename) for filename in sorted(filenames) if in_src or filename == 'pom.xml')
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        digest.update(f'{path}\0{stat.st_mtime_ns}\0{stat.st_size}\n'.encode())
+    return digest.hexdigest()
+
+def run_project(project_name, env_vars):
+    try:
+        project_path = os.path.join(BASE_PATH, project_name)
+        fingerprint = source_fingerprint(project_path)
+        previous = (mapVariables.get('BUILD_HASHES') or {}).get(project_name)
+        clean = fingerprint != previous or not os.path.isdir(os.path.join(project_path, 'target'))
+        process = spawn_command(build_command(project_name, env_vars, clean), project_name)
+        post_to_ui(lambda: mapVariables.add_dict('BUILD_HASHES', project_name, fingerprint))
+    except Exception as e:
+        append_log(project_name, f'Error al iniciar {project_name}: {str(e)}\n')
+        return
+    finally:
+        post_to_ui(lambda: _starting.discard(project_name))
+    run_command(process, project_name)
+
+_starting = set()
+
+def start_project(project_name):
+    if check_and_stop_process(project_name):
+        return
+    _starting.add(project_name)
     default_vars = mapVariables.get('default_env_vars') or {}
     project_vars = mapVariables.get_or_default(project_name, {})
-    env_vars = {**default_vars, **project_vars}
-    env_str = ' --'.join([f'{key}={value}' for key, value in env_vars.items()])
-    command = f'cd {os.path.join(BASE_PATH, project_name)} && mvn clean compile spring-boot:run -Dspring-boot.run.arguments="{env_str}"'
-    threading.Thread(target=run_command, args=(command, project_name, log_widget)).start()
+    env_vars = default_vars | project_vars
+    threading.Thread(target=run_project, args=(project_name, env_vars)).start()
 
-def stop_project(project_name, log_widget):
-    if check_and_stop_process(project_name, log_widget):
+def stop_project(project_name):
+    if check_and_stop_process(project_name):
         return
 
-def check_and_stop_process(project_name, log_widget):
-    processes = mapVariables.get('PIDS') or {}
-    if project_name in processes:
-        pid = processes[project_name]
-        if is_process_running(pid):
-            try:
-                os.killpg(os.getpgid(pid), signal.SIGTERM)
-                os.killpg(os.getpgid(pid), signal.SIGKILL)
-            except OSError as e:
-                log_widget.insert(tk.END, f'Error al detener {project_name}: {str(e)}\n')
-            log_widget.insert(tk.END, f'{project_name} detenido\n')
-            log_widget.yview(tk.END)
-            mapVariables.remove_dict('PIDS', project_name)
-            return True
+_stopping = set()
+
+def check_and_stop_process(project_name, on_stopped=None):
+    if project_name in _starting or project_name in _stopping:
+        return True
+    process = _live_processes.get(project_name)
+    if process is not None:
+        pid = process.pid
+        running = process.poll() is None
+    else:
+        pid = (mapVariables.get('PIDS') or {}).get(project_name)
+        running = pid is not None and is_process_running(pid)
+    if running:
+        _stopping.add(project_name)
+        mapVariables.remove_dict('PIDS', project_name)
+        threading.Thread(target=stop_process, args=(project_name, pid, on_stopped)).start()
+        return True
     return False
 
-def restart_project(project_name, log_widget):
-    stop_project(project_name, log_widget)
-    start_project(project_name, log_widget)
+def stop_process(project_name, pid, on_stopped=None):
+    try:
+        terminate_process_group(pid)
+    except OSError as e:
+        append_log(project_name, f'Error al detener {project_name}: {str(e)}\n')
+    append_log(project_name, f'{project_name} detenido\n')
+    post_to_ui(lambda: finish_stop(project_name, on_stopped))
+
+def finish_stop(project_name, on_stopped):
+    _stopping.discard(project_name)
+    if on_stopped:
+        on_stopped()
+
+def restart_project(project_name):
+    if not check_and_stop_process(project_name, on_stopped=lambda: start_project(project_name)):
+        start_project(project_name)
 
 def detect_projects():
-    projects = [name for name in os.listdir(BASE_PATH) if os.path.isdir(os.path.join(BASE_PATH, name))]
+    with os.scandir(BASE_PATH) as entries:
+        projects = [entry.name for entry in entries if entry.is_dir()]
     return projects
 
 root = tk.Tk()
@@ -124,10 +370,6 @@ projects = detect_projects()
 for project in projects:
     project_list.insert(tk.END, project)
 
-if projects:
-    project_list.selection_set(0)
-    load_project_details(None)
-
 variables_frame = ttk.Frame(details_frame)
 variables_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
 
@@ -146,10 +388,8 @@ env_vars_text.pack(fill=tk.BOTH, expand=True)
 log_frame = ttk.LabelFrame(details_frame, text="Logs")
 log_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-log_texts = {}
-for project in projects:
-    log_texts[project] = scrolledtext.ScrolledText(log_frame, height=10)
-    log_texts[project].pack(fill=tk.BOTH, expand=True)
+log_text = scrolledtext.ScrolledText(log_frame, height=10)
+log_text.pack(fill=tk.BOTH, expand=True)
 
 def load_project_details(event):
     if not project_list.curselection():
@@ -168,50 +408,45 @@ def load_project_details(event):
         for key, value in project_env_vars.items():
             env_vars_text.insert(tk.END, f'{key}={value}\n')
 
-    for text_widget in log_texts.values():
-        text_widget.pack_forget()
-    log_texts[selected_project].pack(fill=tk.BOTH, expand=True)
+    show_log(selected_project)
 
 project_list.bind("<<ListboxSelect>>", load_project_details)
 
+if projects:
+    project_list.selection_set(0)
+    load_project_details(None)
+
+def parse_env_text(text_widget):
+    env_vars = {}
+    for line in text_widget.get('1.0', tk.END).splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            env_vars[key.strip()] = value.strip()
+    return env_vars
+
 def save_common_env(event=None):
-    default_env_vars = {}
-    common_vars_text_content = common_vars_text.get(1.0, tk.END).strip().split('\n')
-    for line in common_vars_text_content:
-        if '=' in line:
-            key, value = line.strip().split('=', 1)
-            default_env_vars[key] = value
-    mapVariables.set('default_env_vars', default_env_vars)
+    mapVariables.set('default_env_vars', parse_env_text(common_vars_text))
 
 def save_project_env(event=None):
     if not project_list.curselection():
         return
     selected_project = project_list.get(project_list.curselection())
-    env_vars = {}
-    env_vars_text_content = env_vars_text.get(1.0, tk.END).strip().split('\n')
-    for line in env_vars_text_content:
-        if '=' in line:
-            key, value = line.strip().split('=', 1)
-            env_vars[key] = value
-    mapVariables.set(selected_project, env_vars)
-
-def stop_all_processes(log_widget):
+    mapVariables.set(selected_project, parse_env_text(env_vars_text))
+
+def stop_all_processes():
     processes = mapVariables.get('PIDS') or {}
-    processes_to_remove = []
-    for project_name, pid in processes.items():
-        if is_process_running(pid):
-            try:
-                os.killpg(os.getpgid(pid), signal.SIGTERM)
-                os.killpg(os.getpgid(pid), signal.SIGKILL)
-            except OSError as e:
-                log_widget.insert(tk.END, f'Error al detener {project_name}: {str(e)}\n')
-            log_widget.insert(tk.END, f'{project_name} detenido\n')
-            print(f'{project_name} detenido\n')
-            log_widget.yview(tk.END)
-            processes_to_remove.append(project_name)
-
-    for project_name in processes_to_remove:
+    running = [(project_name, pid) for project_name, pid in processes.items()
+               if project_name not in _stopping and is_process_running(pid)]
+    for project_name, pid in running:
+        _stopping.add(project_name)
+        on_stopped = lambda project_name=project_name, pid=pid: remove_pid(project_name, pid)
+        threading.Thread(target=stop_process, args=(project_name, pid, on_stopped)).start()
+
+def remove_pid(project_name, pid):
+    processes = mapVariables.get('PIDS') or {}
+    if processes.get(project_name) == pid:
         mapVariables.remove_dict('PIDS', project_name)
+        print(f'{project_name} detenido\n')
 
 common_vars_text.bind("<FocusOut>", save_common_env)
 env_vars_text.bind("<FocusOut>", save_project_env)
@@ -219,11 +454,12 @@ env_vars_text.bind("<FocusOut>", save_project_env)
 buttons_frame = ttk.Frame(details_frame)
 buttons_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=10)
 
-ttk.Button(buttons_frame, text="Iniciar", command=lambda: start_project(project_list.get(tk.ACTIVE), log_texts[project_list.get(tk.ACTIVE)])).pack(side=tk.LEFT, padx=5, pady=5)
-ttk.Button(buttons_frame, text="Detener", command=lambda: stop_project(project_list.get(tk.ACTIVE), log_texts[project_list.get(tk.ACTIVE)])).pack(side=tk.LEFT, padx=5, pady=5)
-ttk.Button(buttons_frame, text="Reiniciar", command=lambda: restart_project(project_list.get(tk.ACTIVE), log_texts[project_list.get(tk.ACTIVE)])).pack(side=tk.LEFT, padx=5, pady=5)
+ttk.Button(buttons_frame, text="Iniciar", command=lambda: start_project(project_list.get(tk.ACTIVE))).pack(side=tk.LEFT, padx=5, pady=5)
+ttk.Button(buttons_frame, text="Detener", command=lambda: stop_project(project_list.get(tk.ACTIVE))).pack(side=tk.LEFT, padx=5, pady=5)
+ttk.Button(buttons_frame, text="Reiniciar", command=lambda: restart_project(project_list.get(tk.ACTIVE))).pack(side=tk.LEFT, padx=5, pady=5)
 ttk.Button(buttons_frame, text="Guardar Variables", command=save_project_env).pack(side=tk.LEFT, padx=5, pady=5)
 
-stop_all_processes(log_texts[project_list.get(tk.ACTIVE)])
+stop_all_processes()
 
+root.after(LOG_DRAIN_INTERVAL_MS, drain_log_queue)
 root.mainloop()